@@ -9,39 +9,74 @@ import os
 import sys
 from pathlib import Path
 import logging
-import base64
 import tempfile
 import shutil
-import re
-from typing import List, Optional, Dict
+import html
+import io
+import itertools
+import operator
+import subprocess
+from functools import cached_property
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import List, Optional, Dict, Tuple
 
-# 设置递归限制，防止递归过深
+# 设置递归限制，防止WeasyPrint排版和HTML解析时递归过深
 sys.setrecursionlimit(3000)
 
 try:
     import ebooklib
     from ebooklib import epub
+    import lxml.etree
+    import lxml.html
+    from PIL import Image, ImageOps
     import weasyprint
     from weasyprint import HTML, CSS
+    from weasyprint.text.fonts import FontConfiguration
+    from pypdf import PdfReader, PdfWriter
 except ImportError as e:
     print(f"缺少必要的依赖包: {e}")
     print("请运行: pip install -r requirements.txt")
     sys.exit(1)
 
 
+# 图片的最大边长（像素），超过时缩小后再写入，PDF中很少需要更高的分辨率
+_MAX_IMAGE_DIMENSION = 1600
+
+# 章节内容直接以UTF-8字节解析，省去先解码为字符串再编码回字节的过程；
+# huge_tree解除libxml2约256层的嵌套深度限制，否则超出部分及其后的内容会被直接丢弃
+_HTML_PARSER = lxml.html.HTMLParser(encoding='utf-8', huge_tree=True)
+
+
 class EPUBtoPDFConverter:
     """EPUB转PDF转换器"""
     
-    def __init__(self, source_dir: str = "source_book", output_dir: str = "output_book"):
+    def __init__(self, source_dir: str = "source_book", output_dir: str = "output_book",
+                 max_workers: Optional[int] = None, optimize_images: bool = True,
+                 jpeg_quality: int = 85, chunk_chapters: int = 0):
         """
         初始化转换器
         
         Args:
             source_dir: EPUB文件源目录
             output_dir: PDF文件输出目录
+            max_workers: 并行转换的最大进程数，默认为CPU核心数
+            optimize_images: 是否在生成PDF时优化图片以减小文件体积
+            jpeg_quality: 生成PDF时JPEG图片的压缩质量(0-95)
+            chunk_chapters: 章节数超过该值时分批渲染再合并PDF，以限制内存占用；每批从新的一页开始，默认为0即不分批
         """
         self.source_dir = Path(source_dir)
         self.output_dir = Path(output_dir)
+        self.max_workers = max_workers or os.cpu_count()
+        self.chunk_chapters = chunk_chapters
+        
+        # 批量转换时预先建立的已有PDF索引 {EPUB相对路径: PDF修改时间}
+        self._pdf_index: Optional[Dict[Path, float]] = None
+        
+        # 传给WeasyPrint的PDF生成选项
+        self.pdf_options = {
+            'optimize_images': optimize_images,
+            'jpeg_quality': jpeg_quality,
+        }
         
         # 确保输出目录存在
         self.output_dir.mkdir(exist_ok=True)
@@ -53,6 +88,68 @@ class EPUBtoPDFConverter:
         )
         self.logger = logging.getLogger(__name__)
     
+    @cached_property
+    def font_config(self) -> FontConfiguration:
+        """
+        所有书籍共用的字体配置，@font-face字体只需加载一次
+        
+        首次渲染时才创建：批量转换时主进程不做渲染，避免在创建进程池前初始化fontconfig/Pango
+        """
+        return FontConfiguration()
+    
+    @cached_property
+    def _font_file(self) -> Optional[str]:
+        """首次生成HTML时解析一次中文字体文件，避免每本书都由fontconfig查找字体"""
+        return self._find_cjk_font()
+    
+    def _find_cjk_font(self) -> Optional[str]:
+        """
+        通过fontconfig查找用于正文的中文字体文件
+        
+        Returns:
+            字体文件路径；fontconfig不可用、匹配到的字体不支持中文或位于字体集合(TTC)中时返回None
+        """
+        try:
+            # 查询与样式表相同的字体列表；fontconfig总会返回某个字体，因此同时输出其支持的语言
+            result = subprocess.run(
+                ['fc-match', '-f', '%{file}\\n%{index}\\n%{lang}', 'SimSun,宋体,serif:lang=zh-cn'],
+                capture_output=True, text=True, timeout=10
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            self.logger.debug(f"无法通过fontconfig查找字体: {e}")
+            return None
+        
+        if result.returncode != 0:
+            return None
+        
+        font_file, _, rest = result.stdout.partition('\n')
+        index, _, langs = rest.partition('\n')
+        font_file = font_file.strip()
+        if not font_file or not Path(font_file).is_file():
+            return None
+        
+        # WeasyPrint会把@font-face的名字加到字体文件中的所有字体上，字体集合中可能选中
+        # 日文、韩文或繁体字形而不是fontconfig匹配的那一个，因此只使用单一字体文件
+        if index.strip() != '0' or self._is_font_collection(font_file):
+            self.logger.debug(f"匹配到的字体位于字体集合中，不使用: {font_file}")
+            return None
+        
+        # 匹配结果不支持中文时（例如系统没有安装中文字体）保持原有样式表不变
+        if 'zh-cn' not in langs.strip().split('|'):
+            self.logger.debug(f"匹配到的字体不支持中文，不使用: {font_file}")
+            return None
+        
+        self.logger.info(f"使用字体: {font_file}")
+        return font_file
+    
+    def _is_font_collection(self, font_file: str) -> bool:
+        """根据文件头判断字体文件是否为字体集合(TTC/OTC)"""
+        try:
+            with open(font_file, 'rb') as f:
+                return f.read(4) == b'ttcf'
+        except OSError:
+            return True
+    
     def find_epub_files(self) -> List[Path]:
         """
         查找源目录下的所有EPUB文件
@@ -97,6 +194,10 @@ class EPUBtoPDFConverter:
         Returns:
             如果已转换返回True，否则返回False
         """
+        if self._pdf_index is not None:
+            pdf_mtime = self._pdf_index.get(epub_path.relative_to(self.source_dir))
+            return pdf_mtime is not None and pdf_mtime >= epub_path.stat().st_mtime
+        
         pdf_path = self.get_output_path(epub_path)
         if pdf_path.exists():
             # 比较文件修改时间，如果PDF比EPUB新，则认为已转换
@@ -105,15 +206,29 @@ class EPUBtoPDFConverter:
             return pdf_mtime >= epub_mtime
         return False
     
-    def extract_epub_content(self, epub_path: Path) -> Optional[str]:
+    def _build_pdf_index(self) -> Dict[Path, float]:
         """
-        从EPUB文件中提取HTML内容
+        一次遍历输出目录，建立已有PDF的索引，避免逐个文件检查是否存在
+        
+        Returns:
+            已有PDF索引 {对应的EPUB相对路径: PDF修改时间}
+        """
+        pdf_index = {}
+        for pdf_path in self.output_dir.rglob('*.pdf'):
+            relative_path = pdf_path.relative_to(self.output_dir).with_suffix('.epub')
+            pdf_index[relative_path] = pdf_path.stat().st_mtime
+        return pdf_index
+    
+    def _extract_chapters(self, epub_path: Path, image_dir: Path) -> Optional[Tuple[str, str, List[bytes]]]:
+        """
+        从EPUB文件中提取书籍信息和按阅读顺序排列的章节HTML
         
         Args:
             epub_path: EPUB文件路径
+            image_dir: 存放提取出的图片文件的目录
             
         Returns:
-            提取的HTML内容，失败时返回None
+            (标题, 作者, 章节HTML列表)，失败时返回None
         """
         try:
             book = epub.read_epub(str(epub_path))
@@ -124,270 +239,336 @@ class EPUBtoPDFConverter:
             
             self.logger.info(f"处理书籍: {title} - {author}")
             
-            # 提取图片资源
-            images = self.extract_images_from_epub(book)
-            
-            # 构建HTML内容
-            html_content = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <meta charset="utf-8">
-                <title>{title}</title>
-                <style>
-                    body {{
-                        font-family: "SimSun", "宋体", serif;
-                        font-size: 12pt;
-                        line-height: 1.6;
-                        margin: 2cm;
-                        text-align: justify;
-                    }}
-                    h1, h2, h3, h4, h5, h6 {{
-                        font-weight: bold;
-                        margin-top: 1em;
-                        margin-bottom: 0.5em;
-                    }}
-                    h1 {{ font-size: 18pt; }}
-                    h2 {{ font-size: 16pt; }}
-                    h3 {{ font-size: 14pt; }}
-                    p {{ margin: 0.5em 0; }}
-                    img {{
-                        max-width: 100%;
-                        height: auto;
-                        display: block;
-                        margin: 1em auto;
-                    }}
-                    .title-page {{
-                        text-align: center;
-                        margin-bottom: 2em;
-                    }}
-                    .title {{ font-size: 24pt; font-weight: bold; }}
-                    .author {{ font-size: 16pt; margin-top: 1em; }}
-                    @page {{
-                        margin: 2cm;
-                        @bottom-center {{
-                            content: counter(page);
-                        }}
-                    }}
-                </style>
-            </head>
-            <body>
-                <div class="title-page">
-                    <div class="title">{title}</div>
-                    <div class="author">{author}</div>
-                </div>
-            """
-            
-            # 获取所有文档类型的内容
+            # 一次遍历清单，按类型分拣文档和图片
             documents = []
+            image_items = []
             for item in book.get_items():
-                if item.get_type() == ebooklib.ITEM_DOCUMENT:
+                item_type = item.get_type()
+                if item_type == ebooklib.ITEM_DOCUMENT:
                     documents.append(item)
+                elif item_type == ebooklib.ITEM_IMAGE:
+                    image_items.append(item)
+            
+            # 提取图片资源
+            images = self._process_images(image_items, image_dir)
             
             # 按spine顺序排序文档（如果有spine的话）
             if hasattr(book, 'spine') and book.spine:
-                spine_order = {}
-                for index, (item_id, linear) in enumerate(book.spine):
-                    spine_order[item_id] = index
+                spine_order = {item_id: index for index, (item_id, linear) in enumerate(book.spine)}
                 
-                # 按spine顺序排序
-                documents.sort(key=lambda doc: spine_order.get(doc.get_id(), 999))
+                # 按spine顺序排序，不在spine中的文档排在最后
+                ordered = sorted(
+                    ((spine_order.get(doc.get_id(), 1 << 30), doc) for doc in documents),
+                    key=operator.itemgetter(0)
+                )
+                documents = [doc for _, doc in ordered]
             
-            # 添加所有文档内容
+            # 提取所有文档内容
+            chapters = []
             for item in documents:
                 try:
-                    content = item.get_content().decode('utf-8', errors='ignore')
                     # 简单的HTML清理和格式化，并替换图片引用
-                    cleaned_content = self._clean_html_content(content)
-                    content_with_images = self._replace_image_references(cleaned_content, images)
-                    html_content += content_with_images
+                    chapters.append(self._clean_html_content(item.get_content(), images))
                 except Exception as e:
                     self.logger.warning(f"跳过章节 {item.get_id()}: {e}")
                     continue
             
-            html_content += """
-            </body>
-            </html>
-            """
-            
-            return html_content
+            return title, author, chapters
             
         except Exception as e:
             self.logger.error(f"读取EPUB文件失败 {epub_path}: {e}")
             return None
     
-    def _clean_html_content(self, content: str) -> str:
+    def _build_html(self, title: str, author: str, chapters: List[bytes], with_title_page: bool = True) -> bytes:
         """
-        清理和格式化HTML内容
+        将章节HTML组装为完整的HTML文档
         
         Args:
-            content: 原始HTML内容
+            title: 书名
+            author: 作者
+            chapters: 章节HTML列表
+            with_title_page: 是否在开头添加标题页
             
         Returns:
-            清理后的HTML内容
-        """
-        # 移除XML声明和DOCTYPE
-        content = re.sub(r'<\?xml[^>]*\?>', '', content)
-        content = re.sub(r'<!DOCTYPE[^>]*>', '', content)
-        
-        # 提取body内容
-        body_match = re.search(r'<body[^>]*>(.*?)</body>', content, re.DOTALL | re.IGNORECASE)
-        if body_match:
-            content = body_match.group(1)
-        else:
-            # 如果没有body标签，移除html和head标签
-            content = re.sub(r'<html[^>]*>', '', content, flags=re.IGNORECASE)
-            content = re.sub(r'</html>', '', content, flags=re.IGNORECASE)
-            content = re.sub(r'<head[^>]*>.*?</head>', '', content, flags=re.DOTALL | re.IGNORECASE)
-        
-        return content
+            UTF-8编码的完整HTML内容
+        """
+        # 优先使用预先解析的字体文件，WeasyPrint可以直接加载而无需再查找系统字体
+        font_face = ''
+        font_family = '"SimSun", "宋体", serif'
+        if self._font_file:
+            # 该字体只注册为常规字重
+            font_face = (f'@font-face {{ font-family: "BookFont"; font-weight: normal; '
+                         f'src: url("{Path(self._font_file).as_uri()}"); }}')
+            font_family = f'"BookFont", {font_family}'
+        
+        # 各部分先收集到列表中，最后一次性拼接
+        parts: List[bytes] = [f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="utf-8">
+            <title>{title}</title>
+            <style>
+                {font_face}
+                body {{
+                    font-family: {font_family};
+                    font-size: 12pt;
+                    line-height: 1.6;
+                    margin: 2cm;
+                    text-align: justify;
+                }}
+                h1, h2, h3, h4, h5, h6 {{
+                    font-weight: bold;
+                    margin-top: 1em;
+                    margin-bottom: 0.5em;
+                }}
+                h1 {{ font-size: 18pt; }}
+                h2 {{ font-size: 16pt; }}
+                h3 {{ font-size: 14pt; }}
+                p {{ margin: 0.5em 0; }}
+                img {{
+                    max-width: 100%;
+                    height: auto;
+                    display: block;
+                    margin: 1em auto;
+                }}
+                table {{
+                    table-layout: fixed;
+                    width: 100%;
+                }}
+                td, th {{ overflow: hidden; }}
+                * {{
+                    word-break: normal;
+                    overflow-wrap: break-word;
+                }}
+                .title-page {{
+                    text-align: center;
+                    margin-bottom: 2em;
+                }}
+                .title {{ font-size: 24pt; font-weight: bold; }}
+                .author {{ font-size: 16pt; margin-top: 1em; }}
+                @page {{
+                    margin: 2cm;
+                    @bottom-center {{
+                        content: counter(page);
+                    }}
+                }}
+            </style>
+        </head>
+        <body>
+        """.encode('utf-8')]
+        
+        if with_title_page:
+            parts.append(f"""
+            <div class="title-page">
+                <div class="title">{title}</div>
+                <div class="author">{author}</div>
+            </div>
+            """.encode('utf-8'))
+        
+        parts.extend(chapters)
+        parts.append(b"""
+        </body>
+        </html>
+        """)
+        
+        return b''.join(parts)
     
-    def _replace_image_references(self, content: str, images: Dict[str, str]) -> str:
+    def _clean_html_content(self, content: bytes, images: Dict[str, Path]) -> bytes:
         """
-        替换HTML内容中的图片引用为base64编码的data URL
+        清理和格式化HTML内容，并替换其中的图片引用（只解析和序列化一次）
         
         Args:
-            content: HTML内容
+            content: UTF-8编码的原始HTML内容
             images: 图片映射字典
             
         Returns:
-            替换后的HTML内容
+            UTF-8编码的清理后的HTML内容
+        """
+        if not content.strip():
+            return b''
+        
+        # 使用lxml解析并提取body内容；只有注释或只有head的章节没有正文，返回空内容
+        try:
+            tree = lxml.html.document_fromstring(content, parser=_HTML_PARSER)
+        except lxml.etree.ParserError:
+            return b''
+        
+        # 普通的标签不匹配等错误在EPUB中很常见，只记录调试日志；致命错误意味着内容可能被截断
+        for error in _HTML_PARSER.error_log:
+            if error.level == lxml.etree.ErrorLevels.FATAL:
+                self.logger.warning(f"章节HTML解析出错，内容可能不完整: {error.message}")
+            else:
+                self.logger.debug(f"章节HTML解析警告: {error.message}")
+        
+        body = tree.body
+        if body is None:
+            return b''
+        
+        # 先对原始字节做子串检查，章节中没有相关内容时跳过对整棵树的查找；
+        # 样式只检查<body>之后的部分，因为几乎每个章节的<head>里都有样式表链接
+        # 移除章节自带的样式表和内联样式，统一使用注入的样式，减少WeasyPrint的CSS解析和层叠计算
+        # 'style'同时覆盖<style>标签、style属性（包括"style = ..."写法）和rel="stylesheet"链接
+        body_start = max(content.find(b'<body'), 0)
+        if content.find(b'style', body_start) != -1 or content.find(b'STYLE', body_start) != -1:
+            for element in body.xpath('.//style | .//link[@rel]'):
+                if element.tag == 'style' or 'stylesheet' in element.get('rel').lower():
+                    element.drop_tree()
+            for element in body.xpath('.//*[@style]'):
+                del element.attrib['style']
+        
+        if images and (b'<img' in content or b'<IMG' in content):
+            self._replace_image_references(body, images)
+        
+        return self._inner_html(body)
+    
+    def _replace_image_references(self, element, images: Dict[str, Path]):
+        """
+        将元素内的图片引用原地替换为本地图片文件的file:// URL
+        
+        Args:
+            element: 已解析的HTML元素
+            images: 图片映射字典
         """
         if not images:
-            return content
-            
-        # 匹配所有img标签的src属性
-        img_pattern = r'<img[^>]*src\s*=\s*["\']([^"\']+)["\'][^>]*>'
+            return
         
-        def replace_img_src(match):
-            try:
-                full_tag = match.group(0)
-                src = match.group(1)
-                
-                # 避免处理已经是data URL的图片
-                if src.startswith('data:'):
-                    return full_tag
-                
-                # 预定义的图片路径变换（避免动态扩展导致的问题）
-                possible_keys = [
-                    src,  # 原始路径
-                    src.split('/')[-1],  # 只要文件名
-                    src.replace('../', ''),  # 移除相对路径前缀
-                    src.replace('./', ''),  # 移除当前目录前缀
-                    src.lstrip('/'),  # 移除开头的斜杠
-                    src.replace('images/', ''),  # 移除images目录前缀
-                    src.replace('Images/', ''),  # 移除Images目录前缀（大写）
-                    src.replace('IMAGES/', ''),  # 移除IMAGES目录前缀（全大写）
-                ]
-                
-                # 添加仅文件名的变体（限制数量以避免过度扩展）
-                base_filename = src.split('/')[-1]
-                if base_filename not in possible_keys:
-                    possible_keys.append(base_filename)
-                
-                # 去重并限制数量
-                possible_keys = list(dict.fromkeys(possible_keys))[:10]  # 最多尝试10种变体
-                
-                # 尝试查找匹配的图片
-                for key in possible_keys:
-                    if key and key in images:
-                        # 替换src属性，使用更安全的方式
-                        escaped_image_data = images[key].replace('"', '&quot;')
-                        new_tag = re.sub(
-                            r'src\s*=\s*["\'][^"\']+["\']', 
-                            f'src="{escaped_image_data}"', 
-                            full_tag, 
-                            count=1  # 只替换第一个匹配项
-                        )
-                        return new_tag
-                
-                # 如果没找到匹配的图片，返回原标签但移除src以避免错误
+        for img in element.iter('img'):
+            src = img.get('src')
+            
+            # 避免处理没有src或已经是data URL的图片
+            if not src or src.startswith('data:'):
+                continue
+            
+            # 路径变体已在提取图片时建好索引，这里只需依次尝试原始路径、文件名和去掉开头斜杠的路径
+            image_path = images.get(src) or images.get(src.split('/')[-1]) or images.get(src.lstrip('/'))
+            if image_path:
+                # 替换src属性为本地图片文件的URL
+                img.set('src', image_path.as_uri())
+            else:
+                # 如果没找到匹配的图片，移除src以避免错误
                 self.logger.debug(f"未找到图片: {src}")
-                return re.sub(r'src\s*=\s*["\'][^"\']+["\']', 'src="#"', full_tag, count=1)
-                
-            except Exception as e:
-                self.logger.warning(f"处理图片标签时出错: {e}")
-                return match.group(0)  # 返回原始标签
-        
-        try:
-            # 执行替换，限制替换次数以避免递归过深
-            content = re.sub(img_pattern, replace_img_src, content, flags=re.IGNORECASE)
-            return content
-        except RecursionError as e:
-            self.logger.error(f"图片替换时递归过深: {e}")
-            # 如果递归过深，返回移除所有图片src的版本
-            return re.sub(r'<img[^>]*src\s*=\s*["\'][^"\']+["\']', '<img src="#"', content, flags=re.IGNORECASE)
+                img.set('src', '#')
+    
+    def _inner_html(self, element) -> bytes:
+        """将元素的内部内容（不含元素本身的标签）序列化为UTF-8编码的HTML"""
+        parts = [html.escape(element.text, quote=False).encode('utf-8')] if element.text else []
+        parts.extend(lxml.html.tostring(child, encoding='utf-8') for child in element)
+        return b''.join(parts)
     
-    def extract_images_from_epub(self, book) -> Dict[str, str]:
+    def _process_images(self, image_items: List, image_dir: Path) -> Dict[str, Path]:
         """
-        从EPUB中提取图片资源并转换为base64编码
+        将EPUB中的图片资源写入本地目录，避免以base64内嵌到HTML中
         
         Args:
-            book: EPUB book对象
+            image_items: EPUB中的图片条目列表
+            image_dir: 存放图片文件的目录
             
         Returns:
-            图片文件映射字典 {文件名: base64_data_url}
+            图片文件映射字典 {文件名: 图片文件路径}
         """
         images = {}
         processed_count = 0
         max_images = 500  # 限制最大图片数量，防止内存问题
-        max_size = 5 * 1024 * 1024  # 单个图片最大5MB
         
         try:
-            for item in book.get_items():
-                if item.get_type() == ebooklib.ITEM_IMAGE:
-                    if processed_count >= max_images:
-                        self.logger.warning(f"图片数量超过限制({max_images})，跳过剩余图片")
-                        break
-                        
-                    try:
-                        # 获取图片内容和MIME类型
-                        content = item.get_content()
-                        filename = item.get_name()
-                        
-                        # 检查图片大小
-                        if len(content) > max_size:
-                            self.logger.warning(f"图片 {filename} 太大({len(content)} bytes)，跳过")
-                            continue
-                        
-                        # 根据文件扩展名确定MIME类型
-                        mime_type = self._get_image_mime_type(filename)
-                        
-                        # 转换为base64编码的data URL
-                        base64_content = base64.b64encode(content).decode('utf-8')
-                        data_url = f"data:{mime_type};base64,{base64_content}"
-                        
-                        # 使用有限的路径格式作为键，避免过度扩展
-                        base_name = filename.split('/')[-1]
-                        images[filename] = data_url
-                        if base_name != filename:
-                            images[base_name] = data_url
-                        
-                        processed_count += 1
-                        
-                    except Exception as e:
-                        self.logger.warning(f"处理图片 {item.get_name()} 失败: {e}")
+            if len(image_items) > max_images:
+                self.logger.warning(f"图片数量超过限制({max_images})，跳过剩余图片")
+                image_items = image_items[:max_images]
+            
+            # 图片缩放和写文件时会释放GIL，使用线程池并行处理；map按原顺序返回结果
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                results = executor.map(self._write_image, range(len(image_items)), image_items,
+                                       itertools.repeat(image_dir))
+                for result in results:
+                    if result is None:
                         continue
+                    filename, image_path = result
                     
+                    # 一次性为常见的路径变体建立索引，替换图片引用时只需直接查表
+                    variants = {
+                        filename,  # 原始路径
+                        filename.split('/')[-1],  # 只要文件名
+                        filename.lstrip('/'),  # 移除开头的斜杠
+                        filename.replace('images/', '').replace('Images/', '').replace('IMAGES/', ''),  # 移除images目录前缀
+                    }
+                    for variant in variants:
+                        images.setdefault(variant, image_path)
+                    
+                    processed_count += 1
+                
             unique_images = len(set(images.values()))
             self.logger.info(f"提取了 {unique_images} 个图片资源 (总计 {processed_count} 个引用)")
         except Exception as e:
             self.logger.warning(f"提取图片失败: {e}")
         return images
     
-    def _get_image_mime_type(self, filename: str) -> str:
-        """根据文件扩展名获取MIME类型"""
-        ext = filename.lower().split('.')[-1]
-        mime_types = {
-            'jpg': 'image/jpeg',
-            'jpeg': 'image/jpeg',
-            'png': 'image/png',
-            'gif': 'image/gif',
-            'bmp': 'image/bmp',
-            'svg': 'image/svg+xml',
-            'webp': 'image/webp'
-        }
-        return mime_types.get(ext, 'image/jpeg')
+    def _write_image(self, index: int, item, image_dir: Path) -> Optional[Tuple[str, Path]]:
+        """
+        将单个图片条目写入本地文件
+        
+        Args:
+            index: 图片序号，用于生成文件名
+            item: EPUB图片条目
+            image_dir: 存放图片文件的目录
+            
+        Returns:
+            (EPUB中的文件名, 图片文件路径)，跳过或失败时返回None
+        """
+        max_size = 5 * 1024 * 1024  # 单个图片最大5MB
+        
+        try:
+            # 获取图片内容
+            content = item.get_content()
+            filename = item.get_name()
+            
+            # 缩小尺寸过大的图片，再检查图片大小
+            content = self._downscale_image(content, filename)
+            if len(content) > max_size:
+                self.logger.warning(f"图片 {filename} 太大({len(content)} bytes)，跳过")
+                return None
+            
+            # 写入本地文件，按序号命名以避免同名冲突，保留扩展名供WeasyPrint识别类型
+            image_path = image_dir / f"{index}{os.path.splitext(filename)[1]}"
+            image_path.write_bytes(content)
+            return filename, image_path
+            
+        except Exception as e:
+            self.logger.warning(f"处理图片 {item.get_name()} 失败: {e}")
+            return None
+    
+    def _downscale_image(self, content: bytes, filename: str) -> bytes:
+        """
+        将超过最大边长的图片等比缩小，减少PDF体积和WeasyPrint的图片处理量
+        
+        Args:
+            content: 图片原始内容
+            filename: 图片文件名
+            
+        Returns:
+            缩小后的图片内容；无需缩小或格式不支持（如SVG）时返回原始内容
+        """
+        try:
+            with Image.open(io.BytesIO(content)) as img:
+                if max(img.size) <= _MAX_IMAGE_DIMENSION:
+                    return content
+                
+                image_format = img.format
+                icc_profile = img.info.get('icc_profile')
+                
+                # 重新保存会丢失EXIF方向信息，先按EXIF方向旋转图片，保证缩小后的图片方向正确
+                resized = ImageOps.exif_transpose(img)
+                resized.thumbnail((_MAX_IMAGE_DIMENSION, _MAX_IMAGE_DIMENSION), Image.Resampling.LANCZOS)
+                buffer = io.BytesIO()
+                # 保留ICC色彩配置，避免非sRGB图片偏色
+                resized.save(buffer, format=image_format, optimize=True,
+                             quality=self.pdf_options['jpeg_quality'], icc_profile=icc_profile)
+        except Exception as e:
+            self.logger.debug(f"图片 {filename} 无法缩小，使用原图: {e}")
+            return content
+        
+        self.logger.debug(f"缩小图片 {filename}: {len(content)} -> {buffer.tell()} bytes")
+        return buffer.getvalue()
     
     def convert_epub_to_pdf(self, epub_path: Path) -> bool:
         """
@@ -407,36 +588,102 @@ class EPUBtoPDFConverter:
             
             self.logger.info(f"开始转换: {epub_path.name}")
             
-            # 提取EPUB内容
-            html_content = self.extract_epub_content(epub_path)
-            if not html_content:
-                return False
-            
-            # 生成PDF
-            pdf_path = self.get_output_path(epub_path)
-            
-            # 配置weasyprint，忽略外部资源加载错误
-            import logging as wp_logging
-            wp_logger = wp_logging.getLogger('weasyprint')
-            original_level = wp_logger.level
-            wp_logger.setLevel(wp_logging.CRITICAL)  # 只显示严重错误
-            
-            try:
-                # 使用weasyprint转换HTML为PDF
-                html_doc = HTML(string=html_content, base_url=str(epub_path.parent))
-                html_doc.write_pdf(str(pdf_path))
+            # 图片和分批渲染的中间PDF写入每本书独立的临时目录，转换结束后自动清理
+            with tempfile.TemporaryDirectory(prefix="epub2pdf_") as work_dir:
+                # 提取EPUB内容
+                book_content = self._extract_chapters(epub_path, Path(work_dir))
+                if book_content is None:
+                    return False
+                title, author, chapters = book_content
                 
-                self.logger.info(f"转换完成: {epub_path.name} -> {pdf_path.name}")
-                return True
+                # 生成PDF
+                pdf_path = self.get_output_path(epub_path)
+                
+                # 配置weasyprint，忽略外部资源加载错误
+                import logging as wp_logging
+                wp_logger = wp_logging.getLogger('weasyprint')
+                original_level = wp_logger.level
+                wp_logger.setLevel(wp_logging.CRITICAL)  # 只显示严重错误
                 
-            finally:
-                # 恢复原始日志级别
-                wp_logger.setLevel(original_level)
+                try:
+                    if self.chunk_chapters and len(chapters) > self.chunk_chapters:
+                        self._write_chunked_pdf(title, author, chapters, work_dir, pdf_path)
+                    else:
+                        html_content = self._build_html(title, author, chapters)
+                        document = self._render_document(html_content, work_dir)
+                        pdf_path.write_bytes(document.write_pdf(**self.pdf_options))
+                    
+                    self.logger.info(f"转换完成: {epub_path.name} -> {pdf_path.name}")
+                    return True
+                    
+                finally:
+                    # 恢复原始日志级别
+                    wp_logger.setLevel(original_level)
             
         except Exception as e:
             self.logger.error(f"转换失败 {epub_path.name}: {e}")
             return False
     
+    def _render_document(self, html_content: bytes, base_url: str, first_page: int = 1):
+        """
+        使用WeasyPrint排版HTML内容
+        
+        Args:
+            html_content: UTF-8编码的HTML内容
+            base_url: 解析相对路径的基础目录
+            first_page: 第一页的页码
+            
+        Returns:
+            排版后的WeasyPrint Document对象
+        """
+        # 直接传入字节并显式指定编码，避免WeasyPrint对整本书的HTML做编码探测
+        html_doc = HTML(string=html_content, base_url=base_url, encoding='utf-8')
+        
+        # 分批渲染时让页码接续上一批
+        stylesheets = None
+        if first_page > 1:
+            stylesheets = [CSS(string=f"@page :first {{ counter-set: page {first_page}; }}")]
+        
+        return html_doc.render(font_config=self.font_config, stylesheets=stylesheets, **self.pdf_options)
+    
+    def _write_chunked_pdf(self, title: str, author: str, chapters: List[bytes], work_dir: str, pdf_path: Path):
+        """
+        按章节分批渲染PDF并合并，使内存占用取决于单批大小而不是整本书
+        
+        Args:
+            title: 书名
+            author: 作者
+            chapters: 章节HTML列表
+            work_dir: 存放图片和中间PDF的临时目录
+            pdf_path: 最终PDF文件路径
+        """
+        writer = PdfWriter()
+        page_count = 0
+        
+        for index, start in enumerate(range(0, len(chapters), self.chunk_chapters)):
+            chunk = chapters[start:start + self.chunk_chapters]
+            self.logger.info(f"渲染第 {index + 1} 批章节 ({start + 1}-{start + len(chunk)}/{len(chapters)})")
+            
+            # 只有第一批包含标题页
+            html_content = self._build_html(title, author, chunk, with_title_page=(index == 0))
+            document = self._render_document(html_content, work_dir, first_page=page_count + 1)
+            page_count += len(document.pages)
+            
+            chunk_path = Path(work_dir) / f"chunk_{index}.pdf"
+            chunk_path.write_bytes(document.write_pdf(**self.pdf_options))
+            # 先释放当前批次的排版结果，再渲染下一批
+            del document
+            
+            writer.append(str(chunk_path))
+            
+            # 合并时不会复制文档信息，从第一批中取回WeasyPrint写入的标题、作者等元数据
+            if index == 0:
+                metadata = PdfReader(str(chunk_path)).metadata
+                if metadata:
+                    writer.add_metadata(metadata)
+        
+        writer.write(str(pdf_path))
+    
     def convert_all(self) -> dict:
         """
         转换所有EPUB文件
@@ -452,14 +699,39 @@ class EPUBtoPDFConverter:
         
         results = {"total": len(epub_files), "success": 0, "failed": 0, "skipped": 0}
         
+        pending = []
+        self._pdf_index = self._build_pdf_index()
         for epub_path in epub_files:
             if self.is_already_converted(epub_path):
                 results["skipped"] += 1
                 self.logger.info(f"跳过已转换的文件: {epub_path.name}")
-            elif self.convert_epub_to_pdf(epub_path):
-                results["success"] += 1
             else:
-                results["failed"] += 1
+                pending.append(epub_path)
+        # 索引只反映筛选时的状态，转换开始后不再使用
+        self._pdf_index = None
+        
+        # 每本书的渲染相互独立且为CPU密集型，使用多进程并行转换
+        if pending:
+            # 每个工作进程启动时按相同的参数创建一个转换器，供该进程处理的所有书籍复用
+            options = dict(self.pdf_options, chunk_chapters=self.chunk_chapters)
+            with ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_init_worker,
+                initargs=(self.source_dir, self.output_dir, options)
+            ) as executor:
+                futures = {executor.submit(_convert_one, epub_path): epub_path for epub_path in pending}
+                for future in as_completed(futures):
+                    epub_path = futures[future]
+                    try:
+                        success = future.result()
+                    except Exception as e:
+                        self.logger.error(f"转换失败 {epub_path.name}: {e}")
+                        success = False
+                    
+                    if success:
+                        results["success"] += 1
+                    else:
+                        results["failed"] += 1
         
         # 输出转换结果
         self.logger.info(f"转换完成！总计: {results['total']}, "
@@ -470,6 +742,36 @@ class EPUBtoPDFConverter:
         return results
 
 
+# 工作进程内复用的转换器，由进程池的初始化函数创建
+_worker_converter: Optional[EPUBtoPDFConverter] = None
+
+
+def _init_worker(source_dir: Path, output_dir: Path, options: dict):
+    """
+    进程池初始化函数：在工作进程中创建转换器，字体查找和字体配置只需初始化一次
+    
+    Args:
+        source_dir: EPUB文件源目录
+        output_dir: PDF文件输出目录
+        options: 转换器的其余构造参数
+    """
+    global _worker_converter
+    _worker_converter = EPUBtoPDFConverter(source_dir=str(source_dir), output_dir=str(output_dir), **options)
+
+
+def _convert_one(epub_path: Path) -> bool:
+    """
+    在工作进程中转换单个EPUB文件（模块级函数，便于进程池序列化）
+    
+    Args:
+        epub_path: EPUB文件路径
+        
+    Returns:
+        转换成功返回True，失败返回False
+    """
+    return _worker_converter.convert_epub_to_pdf(epub_path)
+
+
 def main():
     """主函数"""
     converter = EPUBtoPDFConverter()
@@ -60,6 +60,11 @@ if ! python -c "import lxml" 2>/dev/null; then
     NEED_INSTALL=true
 fi
 
+if ! python -c "import pypdf" 2>/dev/null; then
+    echo "   - pypdf: 未安装"
+    NEED_INSTALL=true
+fi
+
 # 如果需要安装依赖
 if [ "$NEED_INSTALL" = true ]; then
     echo "📥 安装依赖包..."
@@ -67,7 +72,7 @@ if [ "$NEED_INSTALL" = true ]; then
     
     # 验证安装是否成功
     echo "🔍 验证依赖安装..."
-    if ! python -c "import ebooklib, weasyprint, PIL, lxml" 2>/dev/null; then
+    if ! python -c "import ebooklib, weasyprint, PIL, lxml, pypdf" 2>/dev/null; then
         echo "❌ 依赖安装失败，请检查错误信息"
         echo "💡 提示：可能需要先安装系统依赖，请参考README.md"
         exit 1